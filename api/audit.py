@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import insert
+from api.database import AuditLog, get_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', 10_000))
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 100))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 1.0))
+# Что делать при переполненной очереди: drop_new — отбросить новое событие, drop_oldest — самое старое
+AUDIT_OVERFLOW = os.getenv('AUDIT_OVERFLOW', 'drop_new')
+
+
+class AuditWriter:
+    """Журнал действий: обработчики кладут события в очередь,
+    фоновая задача пишет их в audit_log пакетными INSERT.
+    """
+
+    def __init__(self, max_size: int, batch_size: int, flush_interval: float, overflow: str):
+        if overflow not in ("drop_new", "drop_oldest"):
+            raise ValueError(f"Неизвестная политика переполнения очереди аудита: {overflow}")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.dropped = 0
+        self.failed = 0
+        self._queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=max_size)
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+    def record(
+        self,
+        tenant: str,
+        action: str,
+        entity: str,
+        entity_id: int,
+        actor_tg_id: int | None = None,
+        **payload: Any
+    ) -> None:
+        """Постановка события в очередь (не блокирует обработчик запроса)"""
+        event = {
+            "tenant_id": tenant,
+            "created_at": datetime.now(timezone.utc),
+            "actor_tg_id": actor_tg_id,
+            "action": action,
+            "entity": entity,
+            "entity_id": entity_id,
+            "payload": jsonable_encoder(payload) if payload else None,
+        }
+        if self._queue.full():
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning("Очередь аудита переполнена, отброшено событий: %d", self.dropped)
+            if self.overflow == "drop_new":
+                return
+            self._queue.get_nowait()
+        self._queue.put_nowait(event)
+
+    def start(self) -> None:
+        # Очередь привязывается к циклу событий при первом ожидании,
+        # поэтому при (пере)запуске создаем новую и переносим в нее накопленное
+        queue = asyncio.Queue(maxsize=self._queue.maxsize)
+        while not self._queue.empty():
+            queue.put_nowait(self._queue.get_nowait())
+        self._queue = queue
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    @property
+    def queued(self) -> int:
+        """Событий, ожидающих записи"""
+        return self._queue.qsize()
+
+    @property
+    def max_size(self) -> int:
+        return self._queue.maxsize
+
+    async def stop(self) -> None:
+        """Остановка с записью всех накопленных событий"""
+        self._closing = True
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while not self._closing:
+            if batch := await self._collect():
+                await self._flush(batch)
+        while not self._queue.empty():
+            await self._flush([self._queue.get_nowait() for _ in range(min(self.batch_size, self._queue.qsize()))])
+
+    async def _collect(self) -> list[dict]:
+        """Ожидание пакета: до batch_size событий или flush_interval с момента первого"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        batch = []
+        while len(batch) < self.batch_size and not self._closing:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+            if len(batch) == 1:
+                deadline = loop.time() + self.flush_interval
+        return batch
+
+    async def _flush(self, batch: list[dict]) -> None:
+        # События клубов с отдельной БД пишутся в их БД
+        by_sessionmaker: dict[Any, list[dict]] = {}
+        for event in batch:
+            by_sessionmaker.setdefault(get_sessionmaker(event["tenant_id"]), []).append(event)
+
+        for session_factory, events in by_sessionmaker.items():
+            try:
+                async with session_factory() as session:
+                    await session.execute(insert(AuditLog).values(events))
+                    await session.commit()
+            except Exception:
+                self.failed += len(events)
+                logger.exception("Не удалось записать %d событий аудита", len(events))
+
+
+audit_writer = AuditWriter(AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL, AUDIT_OVERFLOW)
@@ -0,0 +1,102 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+# Сколько секунд можно отдавать уже готовый результат (0 — только объединение одновременных запросов)
+COALESCE_TTL = float(os.getenv('COALESCE_TTL', 0))
+# Максимум хранимых результатов
+COALESCE_MAX_RESULTS = 1_000
+
+
+# Теги для сброса результатов при записи (у каждого клуба свои)
+def gear_tag(tenant: str, gear_id: int) -> str:
+    return f"{tenant}:gear:{gear_id}"
+
+
+def gear_search_tag(tenant: str) -> str:
+    return f"{tenant}:gear:search"
+
+
+def active_rentals_tag(tenant: str) -> str:
+    return f"{tenant}:rentals:active"
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных запросов на чтение (single-flight).
+
+    Первый запрос с данным ключом выполняет загрузку, остальные ждут ее
+    результат. Ключ помечается тегами, по которым записи сбрасывают
+    и выполняющуюся загрузку, и сохраненный результат.
+    """
+
+    def __init__(self, ttl: float = 0, max_results: int = COALESCE_MAX_RESULTS):
+        self.ttl = ttl
+        self.max_results = max_results
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self._results: dict[Hashable, tuple[float, Any]] = {}
+        self._tags: dict[Hashable, frozenset[str]] = {}
+
+    async def do(self, key: Hashable, tags: Iterable[str], load: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            cached = self._results.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                return cached[1]
+
+            future = self._calls.get(key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Запрос-лидер отменен (клиент отключился) — загружаем сами
+                if future.cancelled():
+                    continue
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self._tags[key] = frozenset(tags)
+        try:
+            value = await load()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # ожидающих может не быть
+            raise
+        else:
+            future.set_result(value)
+            # Если за время загрузки ключ был сброшен записью, результат не сохраняем
+            if self.ttl > 0 and self._calls.get(key) is future:
+                self._store(key, value)
+            return value
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+                if key not in self._results:
+                    del self._tags[key]
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        now = time.monotonic()
+        if len(self._results) >= self.max_results:
+            for stale in [k for k, (expires, _) in self._results.items() if expires <= now]:
+                self._drop(stale)
+            if len(self._results) >= self.max_results:
+                self._drop(next(iter(self._results)))
+        self._results[key] = (now + self.ttl, value)
+
+    def _drop(self, key: Hashable) -> None:
+        self._results.pop(key, None)
+        self._calls.pop(key, None)
+        self._tags.pop(key, None)
+
+    def invalidate(self, *tags: str) -> None:
+        """Сброс результатов и выполняющихся загрузок с любым из тегов"""
+        tags = set(tags)
+        for key in [k for k, key_tags in self._tags.items() if key_tags & tags]:
+            self._drop(key)
+
+
+read_coalescer = SingleFlight(ttl=COALESCE_TTL)
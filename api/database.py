@@ -1,9 +1,13 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, Integer, String, Date, Boolean, ForeignKey, BigInteger
+from sqlalchemy import (
+    Column, Integer, String, Date, DateTime, Boolean, ForeignKey, BigInteger, JSON, Index,
+    ForeignKeyConstraint, UniqueConstraint, Sequence, literal_column, text
+)
 from datetime import datetime
 from dotenv import load_dotenv
 import os
+import re
 
 load_dotenv()
 user = os.getenv('DB_USER')
@@ -15,37 +19,109 @@ DATABASE_URL = f"postgresql+asyncpg://{user}:{password}@{host}:5432/{db_name}"
 engine = create_async_engine(DATABASE_URL)
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession)
 
+# Код клуба: заголовок X-Tenant приводится к нижнему регистру, поэтому и коды в настройках тоже
+TENANT_PATTERN = re.compile(r"^[a-z0-9_-]{1,50}$")
+
+
+def normalize_tenant(tenant: str, setting: str) -> str:
+    """Код клуба из настроек; некорректный код — ошибка при старте, а не тихий выбор общей БД"""
+    normalized = tenant.strip().lower()
+    if not TENANT_PATTERN.match(normalized):
+        raise ValueError(f"Некорректный код клуба в {setting}: {tenant!r}")
+    return normalized
+
+
+# Клуб, к которому относятся запросы без явного указания клуба
+DEFAULT_TENANT = normalize_tenant(os.getenv('DEFAULT_TENANT', 'default'), "DEFAULT_TENANT")
+
+# Крупные клубы можно вынести в отдельные БД:
+# TENANT_DATABASES="club_a=postgresql+asyncpg://...;club_b=postgresql+asyncpg://..."
+TENANT_DATABASES: dict[str, str] = {}
+for item in os.getenv('TENANT_DATABASES', '').split(";"):
+    if not item.strip():
+        continue
+    tenant, url = item.split("=", 1)
+    tenant = normalize_tenant(tenant, "TENANT_DATABASES")
+    if tenant in TENANT_DATABASES:
+        raise ValueError(f"Клуб {tenant} указан в TENANT_DATABASES несколько раз")
+    TENANT_DATABASES[tenant] = url.strip()
+tenant_engines = {tenant: create_async_engine(url) for tenant, url in TENANT_DATABASES.items()}
+tenant_sessions = {tenant: sessionmaker(e, class_=AsyncSession) for tenant, e in tenant_engines.items()}
+
+
+def get_engines():
+    """Все движки: общий и выделенные для отдельных клубов"""
+    return [engine, *tenant_engines.values()]
+
+
+def get_sessionmaker(tenant: str) -> sessionmaker:
+    """Фабрика сессий БД, в которой хранятся данные клуба"""
+    return tenant_sessions.get(tenant, AsyncSessionLocal)
+
 # Базовый класс для моделей
 Base = declarative_base()
 
+
+def version_column():
+    """Версия строки для оптимистичной блокировки (If-Match).
+
+    Увеличивается при любом UPDATE через ORM; в явных UPDATE ... RETURNING
+    версия выставляется в самом запросе.
+    """
+    return Column(Integer, nullable=False, default=1, onupdate=literal_column("version") + 1)
+
 # Модель пользователя
 class User(Base):
     __tablename__ = "users"
 
+    tenant_id = Column(String(50), primary_key=True, default=DEFAULT_TENANT)
     id_telegram = Column(BigInteger, primary_key=True)
     full_name = Column(String(100), nullable=False)
     phone = Column(String(20), nullable=False)
     document = Column(String(100), nullable=True)
     is_manager = Column(Boolean, default=False)
+    version = version_column()
+
+# Номер изменения каталога: растет при каждом изменении снаряжения (дельта-синхронизация)
+gear_change_seq = Sequence("gear_change_seq")
 
 # Модель снаряжения
 class Gear(Base):
     __tablename__ = "gear"
+    __table_args__ = (
+        # Название уникально в пределах клуба, индекс используется и для поиска по клубу
+        UniqueConstraint("tenant_id", "name", name="uq_gear_tenant_name"),
+        Index("idx_gear_tenant_change", "tenant_id", "change_seq"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String(100), unique=True, nullable=False)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT)
+    name = Column(String(100), nullable=False)
     total_quantity = Column(Integer, nullable=False)
     available_count = Column(Integer, nullable=False)
     description = Column(String(500), nullable=True)
+    change_seq = Column(BigInteger, gear_change_seq, nullable=False, onupdate=gear_change_seq.next_value())
+    version = version_column()
 
 # Модель аренды
 class Rental(Base):
     __tablename__ = "rentals"
+    __table_args__ = (
+        ForeignKeyConstraint(["tenant_id", "user_telegram_id"], ["users.tenant_id", "users.id_telegram"]),
+        ForeignKeyConstraint(["tenant_id", "issue_manager_tg_id"], ["users.tenant_id", "users.id_telegram"]),
+        ForeignKeyConstraint(["tenant_id", "accept_manager_tg_id"], ["users.tenant_id", "users.id_telegram"]),
+        # Активные выдачи клуба (в том числе по пользователю)
+        Index(
+            "idx_rentals_tenant_active", "tenant_id", "user_telegram_id",
+            postgresql_where=text("return_date IS NULL")
+        ),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_telegram_id = Column(BigInteger, ForeignKey("users.id_telegram"), nullable=False)
-    issue_manager_tg_id = Column(BigInteger, ForeignKey("users.id_telegram"), nullable=False)
-    accept_manager_tg_id = Column(BigInteger, ForeignKey("users.id_telegram"), nullable=True)
+    tenant_id = Column(String(50), nullable=False, default=DEFAULT_TENANT)
+    user_telegram_id = Column(BigInteger, nullable=False)
+    issue_manager_tg_id = Column(BigInteger, nullable=False)
+    accept_manager_tg_id = Column(BigInteger, nullable=True)
     gear_id = Column(Integer, ForeignKey("gear.id"), nullable=False)
     issue_date = Column(Date, default=datetime.utcnow, nullable=False)
     due_date = Column(Date, nullable=False)
@@ -53,7 +129,53 @@ class Rental(Base):
     quantity = Column(Integer, nullable=False)
     event = Column(String(300), nullable=False) #TODO: определить подходящее ограничение
     comment = Column(String(300), nullable=True) #TODO: определить подходящее ограничение
+    version = version_column()
+    # Вклад выдачи в агрегаты статистики (NULL у выдач, заведенных до их появления)
+    issued_quantity = Column(Integer, nullable=True)
+    gear_days = Column(Integer, nullable=True, default=0)
+    overdue_returns = Column(Integer, nullable=True, default=0)
+    overdue_days = Column(Integer, nullable=True, default=0)
+
+# Агрегаты по снаряжению за месяц (обновляются инкрементально при выдаче и возврате)
+class GearMonthStats(Base):
+    __tablename__ = "gear_month_stats"
+
+    tenant_id = Column(String(50), primary_key=True)
+    gear_id = Column(Integer, ForeignKey("gear.id"), primary_key=True)
+    month = Column(Date, primary_key=True)  # первое число месяца выдачи
+    rentals_count = Column(Integer, nullable=False, default=0)
+    quantity_issued = Column(Integer, nullable=False, default=0)
+    gear_days = Column(Integer, nullable=False, default=0)
+    overdue_returns = Column(Integer, nullable=False, default=0)
+    overdue_days = Column(Integer, nullable=False, default=0)
+
+# Агрегаты по мероприятию за месяц
+class EventMonthStats(Base):
+    __tablename__ = "event_month_stats"
+
+    tenant_id = Column(String(50), primary_key=True)
+    event = Column(String(300), primary_key=True)
+    month = Column(Date, primary_key=True)
+    rentals_count = Column(Integer, nullable=False, default=0)
+    quantity_issued = Column(Integer, nullable=False, default=0)
+    gear_days = Column(Integer, nullable=False, default=0)
+    overdue_returns = Column(Integer, nullable=False, default=0)
+    overdue_days = Column(Integer, nullable=False, default=0)
+
+# Журнал действий (пишется пакетами фоновой задачей, см. api/audit.py)
+class AuditLog(Base):
+    __tablename__ = "audit_log"
+    __table_args__ = (
+        Index("idx_audit_tenant", "tenant_id", "id"),
+        Index("idx_audit_entity", "tenant_id", "entity", "entity_id"),
+        Index("idx_audit_actor", "tenant_id", "actor_tg_id"),
+    )
 
-async def get_db():
-    async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    tenant_id = Column(String(50), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    actor_tg_id = Column(BigInteger, nullable=True)
+    action = Column(String(50), nullable=False)
+    entity = Column(String(20), nullable=False)
+    entity_id = Column(BigInteger, nullable=False)
+    payload = Column(JSON, nullable=True)
\ No newline at end of file
@@ -1,15 +1,43 @@
-from fastapi import Depends, HTTPException
+import os
+import re
+from fastapi import Depends, Header, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from api.database import Gear, Rental, User, get_db
-from api.services.gear import get_gear_by_id
-from api.services.rental import get_rental_by_id
+from api.database import DEFAULT_TENANT, TENANT_PATTERN, User, get_sessionmaker, normalize_tenant
 from api.services.user import get_user_by_telegram_id
 
+# Список тегов сущности в If-Match: "3", W/"4"
+ENTITY_TAG_PATTERN = re.compile(r'(W/)?"([^"]*)"')
+IF_MATCH_PATTERN = re.compile(r'\s*(?:W/)?"[^"]*"(?:\s*,\s*(?:W/)?"[^"]*")*\s*')
+# Если задан, принимаются только перечисленные клубы: TENANTS="club_a,club_b"
+ALLOWED_TENANTS = {normalize_tenant(t, "TENANTS") for t in os.getenv('TENANTS', '').split(",") if t.strip()}
+
+
+async def get_tenant(
+    x_tenant: str | None = Header(default=None, description="Код клуба")
+) -> str:
+    """Определение клуба, от имени которого выполняется запрос"""
+    if x_tenant is None:
+        return DEFAULT_TENANT
+    tenant = x_tenant.strip().lower()
+    if not TENANT_PATTERN.match(tenant) or (ALLOWED_TENANTS and tenant not in ALLOWED_TENANTS | {DEFAULT_TENANT}):
+        raise HTTPException(status_code=400, detail="Неизвестный клуб")
+    return tenant
+
+
+async def get_db(tenant: str = Depends(get_tenant)):
+    """Сессия БД клуба (крупные клубы могут жить в отдельной БД)"""
+    async with get_sessionmaker(tenant)() as session:
+        yield session
+
+
 async def get_current_user(
     id_telegram: int,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    tenant: str = Depends(get_tenant)
 ) -> User:
-    user = await get_user_by_telegram_id(id_telegram, db)
+    user = await get_user_by_telegram_id(id_telegram, tenant, db)
     if not user:
         raise HTTPException(
             status_code=404,
@@ -19,23 +47,58 @@ async def get_current_user(
 
 
 
-async def get_valid_gear(
-    gear_id: int,
-    db: AsyncSession = Depends(get_db)
-) -> Gear:
-    """Проверка существования снаряжения"""
-    if gear := await get_gear_by_id(gear_id, db):
-        return gear
-    raise HTTPException(
-        status_code=404,
-        detail="Снаряжение не найдено" # TODO: добавить схему ошибки, чтобы в свагере не отображалось как undocumented
+async def get_editing_manager(
+    manager_tg_id: int = Query(..., description="ID менеджера, вносящего изменения"),
+    db: AsyncSession = Depends(get_db),
+    tenant: str = Depends(get_tenant)
+) -> int:
+    """Менеджер клуба, от имени которого вносятся изменения (автор записи в журнале действий)"""
+    result = await db.execute(
+        select(User.is_manager).where(User.tenant_id == tenant, User.id_telegram == manager_tg_id)
     )
+    is_manager = result.scalar_one_or_none()
+    if is_manager is None:
+        raise HTTPException(status_code=404, detail="Менеджер не найден")
+    if not is_manager:
+        raise HTTPException(status_code=403, detail="Изменения может вносить только менеджер")
+    return manager_tg_id
+
+
+async def get_if_match(
+    if_match: str | None = Header(default=None, description='Версии записи из ETag, например "3" или "3", "4"')
+) -> list[int] | None:
+    """Версии записи, при которых разрешено условное обновление (If-Match).
 
+    None — условия нет. Сравнение строгое (RFC 9110): слабые теги W/"3" и теги
+    не из версий ни с чем не совпадают, и обновление получит 412.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    if not IF_MATCH_PATTERN.fullmatch(if_match):
+        raise HTTPException(status_code=400, detail="Некорректный заголовок If-Match")
+    return [
+        int(value)
+        for weak, value in ENTITY_TAG_PATTERN.findall(if_match)
+        if not weak and value.isdigit()
+    ]
 
-async def get_valid_rental(
-    rental_id: int,
-    db: AsyncSession = Depends(get_db)
-) -> Rental:
-    if rental := await get_rental_by_id(rental_id, db):
-        return rental
-    raise HTTPException(status_code=404, detail="Запись о выдаче не найдена")
\ No newline at end of file
+
+def get_fields(schema: type[BaseModel]):
+    """Фабрика зависимости для параметра ?fields= (список полей через запятую)"""
+    async def dependency(
+        fields: str | None = Query(
+            default=None,
+            description=f"Возвращаемые поля через запятую: {', '.join(schema.model_fields)}"
+        )
+    ) -> list[str] | None:
+        if fields is None:
+            return None
+        requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+        unknown = [f for f in requested if f not in schema.model_fields]
+        if not requested or unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Недопустимые поля: {', '.join(unknown) or fields}"
+            )
+        return requested
+    return dependency
@@ -2,6 +2,7 @@ import psycopg2
 from psycopg2 import sql
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 from dotenv import load_dotenv
+from api.migrations import upgrade_statements
 import os
 
 # Конфигурация БД (замените на свои значения)
@@ -55,28 +56,39 @@ def create_tables():
     commands = (
         """
         CREATE TABLE IF NOT EXISTS users (
-            id_telegram BIGINT PRIMARY KEY,
+            tenant_id TEXT NOT NULL,
+            id_telegram BIGINT NOT NULL,
             full_name TEXT NOT NULL,
             phone TEXT NOT NULL,
             document TEXT,
-            is_manager BOOLEAN DEFAULT FALSE
+            is_manager BOOLEAN DEFAULT FALSE,
+            version INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (tenant_id, id_telegram)
         )
         """,
         """
+        CREATE SEQUENCE IF NOT EXISTS gear_change_seq
+        """,
+        """
         CREATE TABLE IF NOT EXISTS gear (
             id SERIAL PRIMARY KEY,
-            name TEXT NOT NULL UNIQUE,
+            tenant_id TEXT NOT NULL,
+            name TEXT NOT NULL,
             total_quantity INTEGER NOT NULL CHECK (total_quantity >= 0),
             available_count INTEGER NOT NULL CHECK (available_count <= total_quantity),
-            description TEXT
+            description TEXT,
+            change_seq BIGINT NOT NULL DEFAULT nextval('gear_change_seq'),
+            version INTEGER NOT NULL DEFAULT 1,
+            CONSTRAINT uq_gear_tenant_name UNIQUE (tenant_id, name)
         )
         """,
         """
         CREATE TABLE IF NOT EXISTS rentals (
             id SERIAL PRIMARY KEY,
-            user_telegram_id BIGINT NOT NULL REFERENCES users(id_telegram),
-            issue_manager_tg_id BIGINT NOT NULL REFERENCES users(id_telegram),
-            accept_manager_tg_id BIGINT REFERENCES users(id_telegram),
+            tenant_id TEXT NOT NULL,
+            user_telegram_id BIGINT NOT NULL,
+            issue_manager_tg_id BIGINT NOT NULL,
+            accept_manager_tg_id BIGINT,
             gear_id INTEGER NOT NULL REFERENCES gear(id),
             issue_date TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
             due_date DATE NOT NULL,
@@ -84,8 +96,54 @@ def create_tables():
             quantity INTEGER NOT NULL CHECK (quantity > 0),
             event TEXT NOT NULL,
             comment TEXT,
+            version INTEGER NOT NULL DEFAULT 1,
+            issued_quantity INTEGER,
+            gear_days INTEGER,
+            overdue_returns INTEGER,
+            overdue_days INTEGER,
             CHECK (due_date > issue_date::DATE),
-            CHECK (return_date IS NULL OR return_date >= issue_date::DATE)
+            CHECK (return_date IS NULL OR return_date >= issue_date::DATE),
+            FOREIGN KEY (tenant_id, user_telegram_id) REFERENCES users(tenant_id, id_telegram),
+            FOREIGN KEY (tenant_id, issue_manager_tg_id) REFERENCES users(tenant_id, id_telegram),
+            FOREIGN KEY (tenant_id, accept_manager_tg_id) REFERENCES users(tenant_id, id_telegram)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS gear_month_stats (
+            tenant_id TEXT NOT NULL,
+            gear_id INTEGER NOT NULL REFERENCES gear(id),
+            month DATE NOT NULL,
+            rentals_count INTEGER NOT NULL DEFAULT 0,
+            quantity_issued INTEGER NOT NULL DEFAULT 0,
+            gear_days INTEGER NOT NULL DEFAULT 0,
+            overdue_returns INTEGER NOT NULL DEFAULT 0,
+            overdue_days INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (tenant_id, gear_id, month)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS event_month_stats (
+            tenant_id TEXT NOT NULL,
+            event TEXT NOT NULL,
+            month DATE NOT NULL,
+            rentals_count INTEGER NOT NULL DEFAULT 0,
+            quantity_issued INTEGER NOT NULL DEFAULT 0,
+            gear_days INTEGER NOT NULL DEFAULT 0,
+            overdue_returns INTEGER NOT NULL DEFAULT 0,
+            overdue_days INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (tenant_id, event, month)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id BIGSERIAL PRIMARY KEY,
+            tenant_id TEXT NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            actor_tg_id BIGINT,
+            action TEXT NOT NULL,
+            entity TEXT NOT NULL,
+            entity_id BIGINT NOT NULL,
+            payload JSON
         )
         """
     )
@@ -97,16 +155,9 @@ def create_tables():
         for command in commands:
             cursor.execute(command)
 
-        # Создаем индексы для ускорения поиска
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_rentals_user 
-            ON rentals(user_telegram_id) 
-            WHERE return_date IS NULL
-        """)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_gear_name 
-            ON gear(name)
-        """)
+        # Обновляем таблицы, созданные прежними версиями, и создаем индексы
+        for statement in upgrade_statements():
+            cursor.execute(statement)
 
         conn.commit()
         print("Таблицы и индексы созданы")
@@ -0,0 +1,183 @@
+import asyncio
+import math
+import os
+import time
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable
+from fastapi import Depends, HTTPException, Request
+from api.database import tenant_sessions
+from api.dependencies import get_tenant
+
+# Параметры token bucket по классам маршрутов: (пополнение токенов в секунду, емкость).
+# checkout — выдача и прием снаряжения менеджером: группа сдает снаряжение подряд
+RATE_LIMITS = {
+    "read": (float(os.getenv('RATE_LIMIT_READ_PER_SEC', 5)), int(os.getenv('RATE_LIMIT_READ_BURST', 20))),
+    "write": (float(os.getenv('RATE_LIMIT_WRITE_PER_SEC', 1)), int(os.getenv('RATE_LIMIT_WRITE_BURST', 10))),
+    "checkout": (float(os.getenv('RATE_LIMIT_CHECKOUT_PER_SEC', 5)), int(os.getenv('RATE_LIMIT_CHECKOUT_BURST', 100))),
+}
+# Одновременных запросов к одной БД (по умолчанию pool_size + max_overflow движка)
+DB_MAX_CONCURRENCY = int(os.getenv('DB_MAX_CONCURRENCY', 15))
+# Сколько запросов может ждать свободного места и сколько секунд
+DB_MAX_WAITING = int(os.getenv('DB_MAX_WAITING', 30))
+DB_WAIT_TIMEOUT = float(os.getenv('DB_WAIT_TIMEOUT', 0.5))
+# Максимум хранимых bucket'ов (вытесняются давно неактивные)
+MAX_BUCKETS = 10_000
+
+# Параметры запроса, содержащие Telegram ID пользователя
+TELEGRAM_ID_PARAMS = ("id_telegram", "user_id", "manager_tg_id")
+
+
+class TokenBucketLimiter:
+    """Token bucket на каждую пару (класс маршрута, (клуб, Telegram ID))"""
+
+    def __init__(self, limits: dict[str, tuple[float, int]], max_buckets: int = MAX_BUCKETS):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        self._buckets: OrderedDict[tuple[str, tuple[str, int]], tuple[float, float]] = OrderedDict()
+
+    def acquire(self, route_class: str, key: tuple[str, int]) -> float:
+        """Списывает токен. Возвращает 0 или сколько секунд ждать до следующего токена"""
+        rate, capacity = self.limits[route_class]
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop((route_class, key), (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / rate
+
+        self._buckets[(route_class, key)] = (tokens, now)
+        if len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+class ConcurrencyLimiter:
+    """Ограничение числа одновременных запросов к БД с короткой ограниченной очередью"""
+
+    def __init__(self, max_concurrency: int, max_waiting: int, wait_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def acquire(self) -> bool:
+        if self.waiting >= self.max_waiting and self._semaphore.locked():
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.wait_timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+rate_limiter = TokenBucketLimiter(RATE_LIMITS)
+# Лимит конкурентности на каждую БД: общую и выделенные для отдельных клубов
+SHARED_DB = "shared"
+db_limiters = {
+    name: ConcurrencyLimiter(DB_MAX_CONCURRENCY, DB_MAX_WAITING, DB_WAIT_TIMEOUT)
+    for name in (SHARED_DB, *tenant_sessions)
+}
+# Счетчики отклоненных запросов: (причина, класс маршрута) -> количество
+rejections: Counter[tuple[str, str]] = Counter()
+
+
+def get_telegram_id(request: Request) -> int | None:
+    """Telegram ID из параметров пути или запроса"""
+    for params in (request.path_params, request.query_params):
+        for name in TELEGRAM_ID_PARAMS:
+            value = params.get(name)
+            if value is not None:
+                try:
+                    return int(value)
+                except ValueError:
+                    return None
+    return None
+
+
+def get_db_limiter(tenant: str) -> ConcurrencyLimiter:
+    """Лимит конкурентности БД, в которой хранятся данные клуба"""
+    return db_limiters[tenant if tenant in tenant_sessions else SHARED_DB]
+
+
+@asynccontextmanager
+async def db_slot(tenant: str, route_class: str):
+    """Слот лимита конкурентности БД клуба на время обращения к ней (503, если мест нет)"""
+    db_limiter = get_db_limiter(tenant)
+    if not await db_limiter.acquire():
+        rejections["overload", route_class] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Сервис перегружен, повторите запрос позже",
+            headers={"Retry-After": "1"}
+        )
+    try:
+        yield
+    finally:
+        db_limiter.release()
+
+
+def limit_class(route_class: str) -> Callable[[Callable], Callable]:
+    """Класс маршрута для rate limit (ключ RATE_LIMITS)"""
+    if route_class not in RATE_LIMITS:
+        raise ValueError(f"Неизвестный класс маршрута: {route_class}")
+
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.rate_limit_class = route_class
+        return endpoint
+    return decorator
+
+
+def coalesced_read(endpoint: Callable) -> Callable:
+    """Маршрут с объединением одинаковых чтений: слот БД берет только загрузка лидера
+    (with_db_slot), ожидающие ее результата запросы места в лимите не занимают.
+    """
+    endpoint.defer_db_slot = True
+    return endpoint
+
+
+def with_db_slot(tenant: str, load: Callable[[], Awaitable[Any]]) -> Callable[[], Awaitable[Any]]:
+    """Загрузка для read_coalescer, выполняемая под слотом БД клуба"""
+    async def load_with_slot() -> Any:
+        async with db_slot(tenant, "read"):
+            return await load()
+    return load_with_slot
+
+
+async def limit_request(request: Request, tenant: str = Depends(get_tenant)):
+    """Зависимость роутеров, работающих с БД: rate limit по пользователю клуба и лимит конкурентности его БД"""
+    endpoint = request.scope.get("endpoint")
+    # Класс задается маршрутом явно (limit_class); по методу — только для неразмеченных
+    route_class = getattr(endpoint, "rate_limit_class", None)
+    if route_class is None:
+        route_class = "read" if request.method in ("GET", "HEAD") else "write"
+
+    tg_id = get_telegram_id(request)
+    if tg_id is not None:
+        retry_after = rate_limiter.acquire(route_class, (tenant, tg_id))
+        if retry_after:
+            rejections["rate_limit", route_class] += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Слишком много запросов",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
+    if getattr(endpoint, "defer_db_slot", False):
+        yield
+        return
+    async with db_slot(tenant, route_class):
+        yield
@@ -1,16 +1,43 @@
-from fastapi import FastAPI
-from api.routers import users, gear, rentals
-from api.database import engine, Base
+from brotli_asgi import BrotliMiddleware
+from fastapi import Depends, FastAPI
+from api.audit import audit_writer
+from api.limits import limit_request
+from api.routers import users, gear, rentals, stats, limits, audit
+from api.database import DEFAULT_TENANT, Base, engine, tenant_engines
+from api.migrations import upgrade_statements
+from api.responses import NegotiatedResponse
+import os
 
-app = FastAPI(title="storage Romantic API")
+# Ответы меньше порога (в байтах) отдаются без сжатия
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
 
-# Подключение роутеров
-app.include_router(users.router)
-app.include_router(gear.router)
-app.include_router(rentals.router)
+app = FastAPI(title="storage Romantic API", default_response_class=NegotiatedResponse)
+
+# Сжатие brotli, для клиентов без поддержки brotli — gzip
+app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MIN_SIZE, gzip_fallback=True)
+
+# Подключение роутеров (обращения к БД проходят через rate limit и лимит конкурентности)
+db_limits = [Depends(limit_request)]
+app.include_router(users.router, dependencies=db_limits)
+app.include_router(gear.router, dependencies=db_limits)
+app.include_router(rentals.router, dependencies=db_limits)
+app.include_router(stats.router, dependencies=db_limits)
+app.include_router(audit.router, dependencies=db_limits)
+app.include_router(limits.router)
 
 @app.on_event("startup")
 async def init_db():
-    # Создание таблиц (если не Alembic)
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+    # Схема OpenAPI строится при старте, чтобы ошибка в ней не всплыла только в /docs
+    app.openapi()
+    # Создание таблиц (если не Alembic) и обновление старой схемы в общей БД и БД выделенных клубов
+    for tenant, tenant_engine in ((DEFAULT_TENANT, engine), *tenant_engines.items()):
+        async with tenant_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            for statement in upgrade_statements(tenant):
+                await conn.exec_driver_sql(statement)
+    audit_writer.start()
+
+@app.on_event("shutdown")
+async def flush_audit():
+    # Дописываем накопленные события журнала перед остановкой
+    await audit_writer.stop()
\ No newline at end of file
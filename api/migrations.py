@@ -0,0 +1,119 @@
+from api.database import DEFAULT_TENANT
+
+# Таблицы, в которые добавлена колонка клуба
+TENANT_TABLES = ("users", "gear", "rentals", "gear_month_stats", "event_month_stats", "audit_log")
+
+
+def _primary_key(table: str, columns: str, referencing: tuple[tuple[str, str, str], ...] = ()) -> str:
+    """Замена первичного ключа, если в нем еще нет клуба.
+
+    Внешние ключи, ссылающиеся на таблицу, снимаются и создаются заново по новому ключу:
+    referencing — (таблица, колонки, колонки ключа) для каждого из них.
+    """
+    recreate = "\n                ".join(
+        f"ALTER TABLE {source} ADD FOREIGN KEY ({source_columns}) REFERENCES {table}({target_columns});"
+        for source, source_columns, target_columns in referencing
+    )
+    drop_references = "\n                ".join(
+        f"""FOR fk IN SELECT conname FROM pg_constraint
+                    WHERE conrelid = '{source}'::regclass AND confrelid = '{table}'::regclass AND contype = 'f' LOOP
+                    EXECUTE format('ALTER TABLE {source} DROP CONSTRAINT %I', fk);
+                END LOOP;"""
+        for source in dict.fromkeys(source for source, _, _ in referencing)
+    )
+    return f"""
+        DO $$
+        DECLARE
+            fk name;
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint c
+                JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey)
+                WHERE c.conrelid = '{table}'::regclass AND c.contype = 'p' AND a.attname = 'tenant_id'
+            ) THEN
+                {drop_references}
+                EXECUTE format('ALTER TABLE {table} DROP CONSTRAINT %I', (
+                    SELECT conname FROM pg_constraint WHERE conrelid = '{table}'::regclass AND contype = 'p'
+                ));
+                ALTER TABLE {table} ADD PRIMARY KEY ({columns});
+                {recreate}
+            END IF;
+        END $$
+    """
+
+
+def _tenant_index(name: str, definition: str) -> tuple[str, str]:
+    """Индекс, первой колонкой которого идет клуб (старый вариант без клуба пересоздается)"""
+    return (
+        f"""
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = '{name}' AND indexdef NOT LIKE '%tenant_id%') THEN
+                DROP INDEX {name};
+            END IF;
+        END $$
+        """,
+        f"CREATE INDEX IF NOT EXISTS {name} {definition}",
+    )
+
+
+def upgrade_statements(tenant: str = DEFAULT_TENANT) -> list[str]:
+    """Идемпотентное обновление схемы БД до текущих моделей.
+
+    CREATE TABLE IF NOT EXISTS и create_all не меняют существующие таблицы, поэтому
+    недостающие колонки, ключи и индексы добавляются здесь. Уже имеющиеся строки
+    относятся к клубу tenant (для выделенной БД клуба — к нему самому).
+    """
+    return [
+        "CREATE SEQUENCE IF NOT EXISTS gear_change_seq",
+
+        # Клуб во всех таблицах
+        *(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS tenant_id TEXT NOT NULL DEFAULT '{tenant}'"
+            for table in TENANT_TABLES
+        ),
+        *(f"ALTER TABLE {table} ALTER COLUMN tenant_id DROP DEFAULT" for table in TENANT_TABLES),
+
+        # Ключи, начинающиеся с клуба
+        _primary_key("users", "tenant_id, id_telegram", referencing=(
+            ("rentals", "tenant_id, user_telegram_id", "tenant_id, id_telegram"),
+            ("rentals", "tenant_id, issue_manager_tg_id", "tenant_id, id_telegram"),
+            ("rentals", "tenant_id, accept_manager_tg_id", "tenant_id, id_telegram"),
+        )),
+        _primary_key("gear_month_stats", "tenant_id, gear_id, month"),
+        _primary_key("event_month_stats", "tenant_id, event, month"),
+        "ALTER TABLE gear DROP CONSTRAINT IF EXISTS gear_name_key",
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_gear_tenant_name') THEN
+                ALTER TABLE gear ADD CONSTRAINT uq_gear_tenant_name UNIQUE (tenant_id, name);
+            END IF;
+        END $$
+        """,
+
+        # Номер изменения каталога и версии строк
+        "ALTER TABLE gear ADD COLUMN IF NOT EXISTS change_seq BIGINT NOT NULL DEFAULT nextval('gear_change_seq')",
+        *(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1"
+            for table in ("users", "gear", "rentals")
+        ),
+
+        # Вклад выдачи в статистику (у старых выдач остается NULL, см. rental_counters)
+        *(
+            f"ALTER TABLE rentals ADD COLUMN IF NOT EXISTS {column} INTEGER"
+            for column in ("issued_quantity", "gear_days", "overdue_returns", "overdue_days")
+        ),
+
+        # Индексы (первой колонкой идет клуб)
+        "DROP INDEX IF EXISTS idx_rentals_user",
+        "DROP INDEX IF EXISTS idx_gear_name",
+        *_tenant_index(
+            "idx_rentals_tenant_active",
+            "ON rentals(tenant_id, user_telegram_id) WHERE return_date IS NULL"
+        ),
+        *_tenant_index("idx_gear_tenant_change", "ON gear(tenant_id, change_seq)"),
+        *_tenant_index("idx_audit_tenant", "ON audit_log(tenant_id, id)"),
+        *_tenant_index("idx_audit_entity", "ON audit_log(tenant_id, entity, entity_id)"),
+        *_tenant_index("idx_audit_actor", "ON audit_log(tenant_id, actor_tg_id)"),
+    ]
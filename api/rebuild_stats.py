@@ -0,0 +1,20 @@
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.database import Base, get_engines
+from api.services.stats import rebuild_rollups
+
+
+async def main():
+    """Пересчет агрегатов статистики по всей истории выдач (во всех БД клубов)"""
+    for engine in get_engines():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine) as session:
+            await rebuild_rollups(session)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    print("Пересчет статистики выдач...")
+    asyncio.run(main())
+    print("Статистика пересчитана")
@@ -0,0 +1,70 @@
+from contextvars import ContextVar
+from typing import Any, Callable, Coroutine, Mapping
+import msgpack
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from starlette.background import BackgroundTask
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+
+def etag(version: int) -> str:
+    """Значение заголовка ETag по версии записи"""
+    return f'"{version}"'
+
+# Выбранный для текущего запроса формат ответа (выставляется в NegotiatedRoute)
+_use_msgpack: ContextVar[bool] = ContextVar("use_msgpack", default=False)
+
+
+def accepts_msgpack(request: Request) -> bool:
+    """Проверка, запросил ли клиент ответ в msgpack через заголовок Accept"""
+    accept = request.headers.get("accept", "")
+    return any(
+        part.split(";")[0].strip() in (MSGPACK_MEDIA_TYPE, "application/x-msgpack")
+        for part in accept.split(",")
+    )
+
+
+class NegotiatedResponse(JSONResponse):
+    """JSON-ответ, который кодируется в msgpack, если клиент его запросил.
+
+    Содержимое уже сериализовано по response_model, поэтому схемы Pydantic
+    остаются единственным источником формата данных.
+    """
+
+    # Параметры перечислены явно: FastAPI берет status_code по умолчанию из сигнатуры для OpenAPI
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+        media_type: str | None = None,
+        background: BackgroundTask | None = None,
+    ) -> None:
+        self.use_msgpack = _use_msgpack.get()
+        if self.use_msgpack:
+            self.media_type = MSGPACK_MEDIA_TYPE
+        super().__init__(content, status_code, headers, media_type, background)
+        self.headers.setdefault("vary", "Accept")
+
+    def render(self, content: Any) -> bytes:
+        if self.use_msgpack:
+            return msgpack.packb(content)
+        return super().render(content)
+
+
+class NegotiatedRoute(APIRoute):
+    """Маршрут, выбирающий кодировку ответа по заголовку Accept"""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            token = _use_msgpack.set(accepts_msgpack(request))
+            try:
+                return await handler(request)
+            finally:
+                _use_msgpack.reset(token)
+
+        return route_handler
@@ -0,0 +1,39 @@
+from typing import Annotated
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.database import AuditLog
+from api.dependencies import get_db, get_tenant
+from api.limits import limit_class
+from api.responses import NegotiatedRoute
+from api.schemas.audit import AuditList
+
+router = APIRouter(prefix="/api/audit", tags=["Audit"], route_class=NegotiatedRoute)
+
+@router.get("/", response_model=AuditList)
+@limit_class("read")
+async def get_audit_log(
+    db: Annotated[AsyncSession, Depends(get_db)],
+    tenant: Annotated[str, Depends(get_tenant)],
+    entity: str | None = Query(default=None, description="rental, gear или user"),
+    entity_id: int | None = None,
+    actor_tg_id: int | None = Query(default=None, description="ID менеджера, совершившего действие"),
+    action: str | None = None,
+    before_id: int | None = Query(default=None, description="Вернуть записи старше указанной (постраничный вывод)"),
+    limit: int = Query(default=100, gt=0, le=1000)
+):
+    """Журнал действий, от новых к старым"""
+    query = select(AuditLog).where(AuditLog.tenant_id == tenant)
+    if entity is not None:
+        query = query.where(AuditLog.entity == entity)
+    if entity_id is not None:
+        query = query.where(AuditLog.entity_id == entity_id)
+    if actor_tg_id is not None:
+        query = query.where(AuditLog.actor_tg_id == actor_tg_id)
+    if action is not None:
+        query = query.where(AuditLog.action == action)
+    if before_id is not None:
+        query = query.where(AuditLog.id < before_id)
+
+    result = await db.execute(query.order_by(AuditLog.id.desc()).limit(limit))
+    return AuditList(items=result.scalars().all())
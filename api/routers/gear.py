@@ -1,20 +1,28 @@
 from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException
-from api.database import User, get_db, Gear
-from api.dependencies import get_current_user, get_valid_gear
-from api.schemas.gear import GearCreate, GearResponse, GearSearchResponse, GearUpdate
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from api.audit import audit_writer
+from api.coalesce import active_rentals_tag, gear_search_tag, gear_tag, read_coalescer
+from api.limits import coalesced_read, limit_class, with_db_slot
+from api.responses import NegotiatedResponse, NegotiatedRoute, etag
+from api.database import User, Gear
+from api.dependencies import get_current_user, get_db, get_editing_manager, get_fields, get_if_match, get_tenant
+from api.schemas.fields import dump_fields
+from api.schemas.gear import GearChanges, GearCreate, GearResponse, GearSearchResponse, GearUpdate
+from api.services.gear import get_gear_by_id, lock_gear_changes
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import or_, select
+from sqlalchemy import func, or_, select, update
 
-router = APIRouter(prefix="/api/gear", tags=["Gear"])
+router = APIRouter(prefix="/api/gear", tags=["Gear"], route_class=NegotiatedRoute)
 
 @router.post("/", response_model=GearResponse)
+@limit_class("write")
 async def add_gear(
     gear: GearCreate,
-    db: Annotated[AsyncSession, Depends(get_db)]
+    db: Annotated[AsyncSession, Depends(get_db)],
+    tenant: Annotated[str, Depends(get_tenant)]
 ):
 
-    result = await db.execute(select(Gear).where(Gear.name == gear.name))
+    result = await db.execute(select(Gear).where(Gear.tenant_id == tenant, Gear.name == gear.name))
     if result.scalar_one_or_none():
         raise HTTPException(
             status_code=400,
@@ -22,7 +30,9 @@ async def add_gear(
         )
 
     """Добавление снаряжения"""
+    await lock_gear_changes(tenant, db)
     db_gear = Gear(
+        tenant_id=tenant,
         name=gear.name,
         total_quantity=gear.total_quantity,
         available_count=gear.available_count,
@@ -31,59 +41,163 @@ async def add_gear(
     
     db.add(db_gear)
     await db.commit()
+    read_coalescer.invalidate(gear_search_tag(tenant))
     await db.refresh(db_gear)
     
     return db_gear
 
+@router.get("/changes", response_model=GearChanges)
+@limit_class("read")
+async def get_gear_changes(
+    db: Annotated[AsyncSession, Depends(get_db)],
+    tenant: Annotated[str, Depends(get_tenant)],
+    since: int = Query(default=0, ge=0, description="Токен из предыдущего ответа (0 — весь каталог)"),
+    limit: int = Query(default=500, gt=0, le=5000)
+):
+    """Снаряжение, измененное после токена (для локального кэша каталога)"""
+    # Под исключительной блокировкой только фиксируем верхнюю границу и сразу
+    # отпускаем ее, чтобы выдачи и возвраты не ждали чтения всей дельты
+    await lock_gear_changes(tenant, db, exclusive=True)
+    watermark = await db.scalar(
+        select(func.max(Gear.change_seq)).where(Gear.tenant_id == tenant)
+    )
+    await db.commit()
+    watermark = max(watermark or 0, since)
+
+    result = await db.execute(
+        select(Gear)
+        .where(Gear.tenant_id == tenant, Gear.change_seq > since, Gear.change_seq <= watermark)
+        .order_by(Gear.change_seq)
+        .limit(limit)
+    )
+    gear_list = result.scalars().all()
+    has_more = len(gear_list) == limit
+
+    return GearChanges(
+        items=gear_list,
+        next_token=gear_list[-1].change_seq if has_more else watermark,
+        has_more=has_more
+    )
+
 @router.get("/{gear_id}", response_model=GearResponse)
-async def get_gear(gear_id: int, db: Annotated[AsyncSession, Depends(get_db)]):
+@limit_class("read")
+@coalesced_read
+async def get_gear(
+    gear_id: int,
+    db: Annotated[AsyncSession, Depends(get_db)],
+    tenant: Annotated[str, Depends(get_tenant)],
+    fields: Annotated[list[str] | None, Depends(get_fields(GearResponse))]
+):
     """Получение снаряжения по ID"""
-    result = await db.execute(select(Gear).where(Gear.id == gear_id))
-    gear = result.scalar_one_or_none()
-    if gear is None:
-        raise HTTPException(
-            status_code=400,
-            detail="Снаряжение с таким id не существует"
-        )
-    
-    return gear
+    async def load() -> dict:
+        if fields is not None:
+            # Выбираем из БД только запрошенные колонки
+            result = await db.execute(
+                select(*(getattr(Gear, field) for field in fields))
+                .where(Gear.tenant_id == tenant, Gear.id == gear_id)
+            )
+            gear = result.mappings().one_or_none()
+        else:
+            result = await db.execute(select(Gear).where(Gear.tenant_id == tenant, Gear.id == gear_id))
+            gear = result.scalar_one_or_none()
+        if gear is None:
+            raise HTTPException(
+                status_code=400,
+                detail="Снаряжение с таким id не существует"
+            )
+
+        if fields is not None:
+            return dump_fields(GearResponse, gear, fields)
+        return GearResponse.model_validate(gear).model_dump(mode="json")
+
+    # Одинаковые одновременные запросы разделяют одно обращение к БД
+    content = await read_coalescer.do(
+        (tenant, "gear", gear_id, fields and tuple(fields)), [gear_tag(tenant, gear_id)], with_db_slot(tenant, load)
+    )
+    return NegotiatedResponse(content)
 
 @router.get("/search/{name}", response_model=GearSearchResponse)
-async def get_gear_by_name(name: str, db: Annotated[AsyncSession, Depends(get_db)]):
+@limit_class("read")
+@coalesced_read
+async def get_gear_by_name(
+    name: str,
+    db: Annotated[AsyncSession, Depends(get_db)],
+    tenant: Annotated[str, Depends(get_tenant)],
+    fields: Annotated[list[str] | None, Depends(get_fields(GearResponse))]
+):
     """Поиск по названию"""
-    result = await db.execute(
-        select(Gear).where(
-            or_(
-                Gear.name.ilike(f"%{name}%"), 
-                Gear.description.ilike(f"%{name}%")
+    async def load() -> dict:
+        columns = [getattr(Gear, field) for field in fields] if fields is not None else [Gear]
+        result = await db.execute(
+            select(*columns).where(
+                Gear.tenant_id == tenant,
+                or_(
+                    Gear.name.ilike(f"%{name}%"), 
+                    Gear.description.ilike(f"%{name}%")
+                )
             )
         )
-    )
-    gear_list = result.scalars().all()
 
-    return GearSearchResponse(items=gear_list)
+        if fields is not None:
+            return {"items": [dump_fields(GearResponse, row, fields) for row in result.mappings()]}
+
+        gear_list = result.scalars().all()
+
+        return GearSearchResponse(items=gear_list).model_dump(mode="json")
+
+    content = await read_coalescer.do(
+        (tenant, "gear_search", name, fields and tuple(fields)), [gear_search_tag(tenant)], with_db_slot(tenant, load)
+    )
+    return NegotiatedResponse(content)
 
 @router.patch("/{gear_id}", response_model=GearResponse)
+@limit_class("write")
 async def update_gear(
     gear_id: int,
     gear_data: GearUpdate,
+    response: Response,
     db: Annotated[AsyncSession, Depends(get_db)],
-    gear: Gear = Depends(get_valid_gear)
+    tenant: Annotated[str, Depends(get_tenant)],
+    expected_versions: Annotated[list[int] | None, Depends(get_if_match)],
+    manager_tg_id: Annotated[int, Depends(get_editing_manager)]
 ):
     """Обновление информации о снаряжении"""
 
-    # Обновляем только переданные поля
+    # Обновляем только переданные поля одним UPDATE ... RETURNING,
+    # при переданном If-Match — только если версия записи не изменилась
     update_data = gear_data.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(gear, field, value)
+    query = update(Gear).where(Gear.tenant_id == tenant, Gear.id == gear_id)
+    if expected_versions is not None:
+        query = query.where(Gear.version.in_(expected_versions))
+    query = (
+        query.values(**update_data, version=Gear.version + 1)
+        .returning(Gear)
+        .execution_options(synchronize_session=False)
+    )
 
     try:
+        await lock_gear_changes(tenant, db)
+        result = await db.execute(query)
+        gear = result.scalar_one_or_none()
+        if gear is None:
+            await db.rollback()
+            if not await get_gear_by_id(gear_id, tenant, db):
+                raise HTTPException(status_code=404, detail="Снаряжение не найдено")
+            raise HTTPException(status_code=412, detail="Снаряжение было изменено другим пользователем")
+        updated = GearResponse.model_validate(gear)
         await db.commit()
-        await db.refresh(gear)
-        return gear
+    except HTTPException:
+        raise
     except Exception as e:
         await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка при обновлении: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+    read_coalescer.invalidate(
+        gear_tag(tenant, gear_id), gear_search_tag(tenant), active_rentals_tag(tenant)
+    )
+    audit_writer.record(tenant, "gear.update", "gear", gear_id, manager_tg_id, **update_data)
+    response.headers["ETag"] = etag(updated.version)
+    return updated
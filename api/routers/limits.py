@@ -0,0 +1,35 @@
+from fastapi import APIRouter
+from api.audit import audit_writer
+from api.limits import RATE_LIMITS, db_limiters, rejections
+from api.responses import NegotiatedRoute
+
+router = APIRouter(prefix="/api/limits", tags=["Limits"], route_class=NegotiatedRoute)
+
+@router.get("/")
+async def get_limits_stats():
+    """Текущая нагрузка, счетчики отклоненных запросов и потерянных событий аудита"""
+    return {
+        "rate_limits": {
+            route_class: {"per_second": rate, "burst": burst}
+            for route_class, (rate, burst) in RATE_LIMITS.items()
+        },
+        "db": {
+            name: {
+                "max_concurrency": limiter.max_concurrency,
+                "in_flight": limiter.in_flight,
+                "waiting": limiter.waiting,
+            }
+            for name, limiter in db_limiters.items()
+        },
+        "rejected": [
+            {"reason": reason, "route_class": route_class, "count": count}
+            for (reason, route_class), count in rejections.items()
+        ],
+        "audit": {
+            "queued": audit_writer.queued,
+            "max_size": audit_writer.max_size,
+            "overflow": audit_writer.overflow,
+            "dropped": audit_writer.dropped,
+            "failed": audit_writer.failed,
+        },
+    }
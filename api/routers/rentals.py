@@ -1,20 +1,30 @@
 from typing import Annotated
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import exists, select
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from api.responses import NegotiatedResponse, NegotiatedRoute, etag
+from sqlalchemy import exists, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from api.database import Gear, Rental, User, get_db
-from api.dependencies import get_valid_rental
+from api.audit import audit_writer
+from api.coalesce import active_rentals_tag, gear_search_tag, gear_tag, read_coalescer
+from api.limits import coalesced_read, limit_class, with_db_slot
+from api.database import Gear, Rental, User
+from api.dependencies import get_db, get_editing_manager, get_fields, get_if_match, get_tenant
+from api.schemas.fields import dump_fields
 from api.schemas.rental import RentalCreate, RentalResponse, RentalUpdate, RentalsList
+from api.services.gear import get_gear_by_id, lock_gear_changes
+from api.services.rental import get_rental_by_id
+from api.services.stats import get_rollup_contribution, record_issue, record_rekey, record_return
 from datetime import datetime, timezone
 
-router = APIRouter(prefix="/api/rentals", tags=["Rentals"])
+router = APIRouter(prefix="/api/rentals", tags=["Rentals"], route_class=NegotiatedRoute)
 
 @router.post("/", response_model=RentalResponse)
+@limit_class("checkout")
 async def add_record(rental: RentalCreate, 
-                     db: Annotated[AsyncSession, Depends(get_db)]):
+                     db: Annotated[AsyncSession, Depends(get_db)],
+                     tenant: Annotated[str, Depends(get_tenant)]):
     """Добавление записи о выдаче снаряжения"""
     # Проверка существования снаряжения
-    gear = await db.get(Gear, rental.gear_id)
+    gear = await get_gear_by_id(rental.gear_id, tenant, db)
     if not gear:
         raise HTTPException(status_code=404, detail="Снаряжение не найдено")
     
@@ -28,7 +38,7 @@ async def add_record(rental: RentalCreate,
     # Проверка существования пользователя и менеджера
     for tg_id in [rental.user_telegram_id, rental.issue_manager_tg_id]:
         user_exists = await db.execute(
-            select(exists().where(User.id_telegram == tg_id))
+            select(exists().where(User.tenant_id == tenant, User.id_telegram == tg_id))
         )
         if not user_exists.scalar():
             raise HTTPException(status_code=404, detail=f"Пользователь с ID {tg_id} не найден")
@@ -38,22 +48,37 @@ async def add_record(rental: RentalCreate,
     
     # Создание записи об аренде
     db_rental = Rental(
+        tenant_id=tenant,
         user_telegram_id=rental.user_telegram_id,
         issue_manager_tg_id=rental.issue_manager_tg_id,
         gear_id=rental.gear_id,
         due_date=rental.due_date,
         quantity=rental.quantity,
+        issued_quantity=rental.quantity,
         event=rental.event,
         comment=rental.comment
     )
     
-    # Обновление доступного количества снаряжения
+    # Обновление доступного количества снаряжения (меняет и номер изменения каталога)
+    await lock_gear_changes(tenant, db)
     gear.available_count -= rental.quantity
     
     db.add(db_rental)
     db.add(gear)
+    await db.flush()
+
+    # Обновляем агрегаты статистики в той же транзакции
+    await record_issue(db, db_rental)
+
     await db.commit()
+    read_coalescer.invalidate(
+        gear_tag(tenant, rental.gear_id), gear_search_tag(tenant), active_rentals_tag(tenant)
+    )
     await db.refresh(db_rental)
+    audit_writer.record(
+        tenant, "rental.issue", "rental", db_rental.id, rental.issue_manager_tg_id,
+        user_telegram_id=rental.user_telegram_id, gear_id=rental.gear_id, quantity=rental.quantity
+    )
     
     # Добавляем название снаряжения к ответу
     response_data = {
@@ -65,47 +90,78 @@ async def add_record(rental: RentalCreate,
     
 
 @router.get("/active", response_model=RentalsList)
+@limit_class("read")
+@coalesced_read
 async def get_active_rentals(
     db: Annotated[AsyncSession, Depends(get_db)],
+    tenant: Annotated[str, Depends(get_tenant)],
+    fields: Annotated[list[str] | None, Depends(get_fields(RentalResponse))],
     user_id: int | None = None
 ):
     """Получение списка активных выдач снаряжения"""
-    query = select(Rental, Gear.name.label('gear_name')).join(
-        Gear, Rental.gear_id == Gear.id
-    ).where(
-        Rental.return_date.is_(None)  # Ищем записи без даты возврата
-    )
+    async def load() -> dict:
+        if fields is not None:
+            columns = [
+                Gear.name.label('gear_name') if field == 'gear_name' else getattr(Rental, field)
+                for field in fields
+            ]
+        else:
+            columns = [Rental, Gear.name.label('gear_name')]
+
+        query = select(*columns).select_from(Rental).join(
+            Gear, Rental.gear_id == Gear.id
+        ).where(
+            Rental.tenant_id == tenant,
+            Rental.return_date.is_(None)  # Ищем записи без даты возврата
+        )
     
-    if user_id is not None:
-        query = query.where(Rental.user_telegram_id == user_id)
+        if user_id is not None:
+            query = query.where(Rental.user_telegram_id == user_id)
     
-    result = await db.execute(query)
-    rentals_with_gear = result.all()
+        result = await db.execute(query)
+
+        if fields is not None:
+            rentals = [dump_fields(RentalResponse, row, fields) for row in result.mappings()]
+            return {"rentals": rentals}
+
+        rentals_with_gear = result.all()
     
-    # Преобразуем результат в список словарей с объединенными полями
-    rentals = []
-    for rental, gear_name in rentals_with_gear:
-        rental_dict = {
-            **{key: getattr(rental, key) for key in rental.__mapper__.attrs.keys()},
-            'gear_name': gear_name
-        }
-        rentals.append(rental_dict)
+        # Преобразуем результат в список словарей с объединенными полями
+        rentals = []
+        for rental, gear_name in rentals_with_gear:
+            rental_dict = {
+                **{key: getattr(rental, key) for key in rental.__mapper__.attrs.keys()},
+                'gear_name': gear_name
+            }
+            rentals.append(rental_dict)
     
-    return RentalsList(rentals=rentals)
+        return RentalsList(rentals=rentals).model_dump(mode="json")
+
+    # Одинаковые одновременные запросы разделяют одно обращение к БД
+    content = await read_coalescer.do(
+        (tenant, "rentals_active", user_id, fields and tuple(fields)), [active_rentals_tag(tenant)], with_db_slot(tenant, load)
+    )
+    return NegotiatedResponse(content)
 
 @router.patch("/{rental_id}/return", response_model=RentalResponse)
+@limit_class("checkout")
 async def update_return_date(
     rental_id: int,
     db: Annotated[AsyncSession, Depends(get_db)],
+    tenant: Annotated[str, Depends(get_tenant)],
     quantity: int = Query(default=None, description="количество единиц возвращаемого снаряжения данного типа"),
     manager_tg_id: int = Query(..., description="ID менеджера, подтверждающего возврат"),
 ):
     """Отметка о возврате снаряжения"""
-    # Получаем запись об аренде с названием снаряжения
+    # Блокировку каталога берем первой, как и при выдаче, — до строк агрегатов статистики
+    await lock_gear_changes(tenant, db)
+
+    # Получаем запись об аренде с названием снаряжения (запись блокируется до конца возврата)
     result = await db.execute(
         select(Rental, Gear.name.label('gear_name'))
         .join(Gear, Rental.gear_id == Gear.id)
-        .where(Rental.id == rental_id)
+        .where(Rental.tenant_id == tenant, Rental.id == rental_id)
+        .with_for_update(of=Rental)
     )
     rental_data = result.first()
     
@@ -116,7 +172,7 @@ async def update_return_date(
 
     # Проверяем менеджера
     manager_exists = await db.execute(
-        select(exists().where(User.id_telegram == manager_tg_id))
+        select(exists().where(User.tenant_id == tenant, User.id_telegram == manager_tg_id))
     )
     if not manager_exists.scalar():
         raise HTTPException(status_code=404, detail="Менеджер не найден")
@@ -130,21 +186,36 @@ async def update_return_date(
         raise HTTPException(status_code=400, detail=f"Нельзя вернуть больше снаряжения, чем было взято. "
                             + f"Вы пытаетесь вернуть: {quantity}. Можно вернуть: {rental.quantity}.")
 
+    # Возвращаем снаряжение в доступное количество. Строка снаряжения блокируется
+    # до строк агрегатов статистики — в том же порядке, что и при выдаче
+    gear = await db.get(Gear, rental.gear_id)
+    if gear:
+        gear.available_count += quantity
+        await db.flush()
+
+    returned_at = datetime.now(timezone.utc)
+    await record_return(db, rental, quantity, returned_at)
+
+    # Полный возврат или частичный — для журнала действий
+    action = "rental.return" if rental.quantity == quantity else "rental.partial_return"
+
     if rental.quantity == quantity:
         # Обновляем данные
-        rental.return_date = datetime.now(timezone.utc)
+        rental.return_date = returned_at
         rental.accept_manager_tg_id = manager_tg_id
     else:
+        # Частичный возврат фиксируется в журнале действий (rental.partial_return)
         rental.quantity -= quantity
-        #TODO: добавить функцию записи события сдачи не всей снаряги в комментарий к записи об аренде
-
-    # Возвращаем снаряжение в доступное количество
-    gear = await db.get(Gear, rental.gear_id)
-    if gear:
-        gear.available_count += quantity
 
     await db.commit()
     await db.refresh(rental)
+    read_coalescer.invalidate(
+        gear_tag(tenant, rental.gear_id), gear_search_tag(tenant), active_rentals_tag(tenant)
+    )
+    audit_writer.record(
+        tenant, action, "rental", rental_id, manager_tg_id,
+        gear_id=rental.gear_id, quantity=quantity, remaining=rental.quantity if rental.return_date is None else 0
+    )
     
     # Добавляем название снаряжения к ответу
     response_data = {
@@ -156,29 +227,63 @@ async def update_return_date(
 
 
 @router.patch("/{rental_id}", response_model=RentalResponse)
+@limit_class("write")
 async def update_rental(
     rental_id: int,
     rental_data: RentalUpdate,
+    response: Response,
     db: Annotated[AsyncSession, Depends(get_db)],
-    rental: Rental = Depends(get_valid_rental)
+    tenant: Annotated[str, Depends(get_tenant)],
+    expected_versions: Annotated[list[int] | None, Depends(get_if_match)],
+    manager_tg_id: Annotated[int, Depends(get_editing_manager)]
 ):
     update_data = rental_data.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(rental, field, value)
-    
-    await db.commit()
-    await db.refresh(rental)
-    
-    # Получаем название снаряжения
+
+    # При смене снаряжения или мероприятия вклад выдачи в статистику переносится на новый ключ
+    old_contribution = None
+    if update_data.keys() & {"gear_id", "event"}:
+        old_contribution = await get_rollup_contribution(db, tenant, rental_id)
+
+    # Один UPDATE ... RETURNING: снаряжение должно принадлежать тому же клубу,
+    # а его название возвращается подзапросом в том же запросе
+    query = update(Rental).where(
+        Rental.tenant_id == tenant,
+        Rental.id == rental_id,
+        exists().where(Gear.tenant_id == tenant, Gear.id == update_data.get("gear_id", Rental.gear_id))
+    )
+    gear_name_query = select(Gear.name).where(
+        Gear.tenant_id == Rental.tenant_id, Gear.id == Rental.gear_id
+    ).scalar_subquery()
+    if expected_versions is not None:
+        query = query.where(Rental.version.in_(expected_versions))
     result = await db.execute(
-        select(Gear.name).where(Gear.id == rental.gear_id)
+        query.values(**update_data, version=Rental.version + 1)
+        .returning(Rental, gear_name_query.label('gear_name'))
+        .execution_options(synchronize_session=False)
     )
-    gear_name = result.scalar()
-    
+    row = result.first()
+
+    if row is None:
+        await db.rollback()
+        if not await get_rental_by_id(rental_id, tenant, db):
+            raise HTTPException(status_code=404, detail="Запись о выдаче не найдена")
+        if "gear_id" in update_data and not await get_gear_by_id(update_data["gear_id"], tenant, db):
+            raise HTTPException(status_code=404, detail="Снаряжение не найдено")
+        raise HTTPException(status_code=412, detail="Запись о выдаче была изменена другим пользователем")
+
+    rental, gear_name = row
+    if old_contribution is not None:
+        await record_rekey(db, old_contribution, rental)
+
     # Добавляем название снаряжения к ответу
     response_data = {
         **{key: getattr(rental, key) for key in rental.__mapper__.attrs.keys()},
         'gear_name': gear_name
     }
-    
+
+    await db.commit()
+    read_coalescer.invalidate(active_rentals_tag(tenant))
+    audit_writer.record(tenant, "rental.update", "rental", rental_id, manager_tg_id, **update_data)
+    response.headers["ETag"] = etag(response_data["version"])
+
     return response_data
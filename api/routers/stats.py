@@ -0,0 +1,91 @@
+from datetime import date
+from typing import Annotated
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.database import EventMonthStats, Gear, GearMonthStats
+from api.dependencies import get_db, get_tenant
+from api.limits import limit_class
+from api.responses import NegotiatedRoute
+from api.schemas.stats import EventStatsList, GearStatsList, MonthStatsList
+from api.services.stats import month_start
+
+router = APIRouter(prefix="/api/stats", tags=["Stats"], route_class=NegotiatedRoute)
+
+
+def _counters(model):
+    """Суммы счетчиков агрегата за выбранный период"""
+    overdue_returns = func.sum(model.overdue_returns)
+    return (
+        func.sum(model.rentals_count).label("rentals_count"),
+        func.sum(model.quantity_issued).label("quantity_issued"),
+        func.sum(model.gear_days).label("gear_days"),
+        overdue_returns.label("overdue_returns"),
+        (func.sum(model.overdue_days) * 1.0 / func.nullif(overdue_returns, 0)).label("avg_overdue_days"),
+    )
+
+
+def _scope(query, model, tenant: str, month_from: date | None, month_to: date | None):
+    """Агрегаты клуба за период"""
+    query = query.where(model.tenant_id == tenant)
+    if month_from is not None:
+        query = query.where(model.month >= month_start(month_from))
+    if month_to is not None:
+        query = query.where(model.month <= month_start(month_to))
+    return query
+
+
+@router.get("/gear", response_model=GearStatsList)
+@limit_class("read")
+async def get_gear_stats(
+    db: Annotated[AsyncSession, Depends(get_db)],
+    tenant: Annotated[str, Depends(get_tenant)],
+    month_from: date | None = Query(default=None, description="Начало периода (месяц выдачи)"),
+    month_to: date | None = Query(default=None, description="Конец периода (месяц выдачи)"),
+    limit: int = Query(default=10, gt=0, le=100)
+):
+    """Самое востребованное снаряжение за период"""
+    query = select(
+        GearMonthStats.gear_id, Gear.name.label("gear_name"), *_counters(GearMonthStats)
+    ).join(Gear, GearMonthStats.gear_id == Gear.id).group_by(GearMonthStats.gear_id, Gear.name)
+    query = _scope(query, GearMonthStats, tenant, month_from, month_to)
+
+    result = await db.execute(
+        query.order_by(func.sum(GearMonthStats.rentals_count).desc()).limit(limit)
+    )
+    return GearStatsList(items=result.mappings().all())
+
+
+@router.get("/events", response_model=EventStatsList)
+@limit_class("read")
+async def get_event_stats(
+    db: Annotated[AsyncSession, Depends(get_db)],
+    tenant: Annotated[str, Depends(get_tenant)],
+    month_from: date | None = Query(default=None, description="Начало периода (месяц выдачи)"),
+    month_to: date | None = Query(default=None, description="Конец периода (месяц выдачи)"),
+    limit: int = Query(default=10, gt=0, le=100)
+):
+    """Использование снаряжения по мероприятиям"""
+    query = select(EventMonthStats.event, *_counters(EventMonthStats)).group_by(EventMonthStats.event)
+    query = _scope(query, EventMonthStats, tenant, month_from, month_to)
+
+    result = await db.execute(
+        query.order_by(func.sum(EventMonthStats.gear_days).desc()).limit(limit)
+    )
+    return EventStatsList(items=result.mappings().all())
+
+
+@router.get("/months", response_model=MonthStatsList)
+@limit_class("read")
+async def get_month_stats(
+    db: Annotated[AsyncSession, Depends(get_db)],
+    tenant: Annotated[str, Depends(get_tenant)],
+    month_from: date | None = Query(default=None, description="Начало периода (месяц выдачи)"),
+    month_to: date | None = Query(default=None, description="Конец периода (месяц выдачи)")
+):
+    """Итоги по месяцам"""
+    query = select(GearMonthStats.month, *_counters(GearMonthStats)).group_by(GearMonthStats.month)
+    query = _scope(query, GearMonthStats, tenant, month_from, month_to)
+
+    result = await db.execute(query.order_by(GearMonthStats.month))
+    return MonthStatsList(items=result.mappings().all())
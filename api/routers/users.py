@@ -1,22 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException
-from api.dependencies import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, Response
+from api.audit import audit_writer
+from api.responses import NegotiatedResponse, NegotiatedRoute, etag
+from api.dependencies import get_current_user, get_db, get_editing_manager, get_fields, get_if_match, get_tenant
+from api.limits import limit_class
+from api.schemas.fields import dump_fields
 from api.schemas.user import UserCreate, UserList, UserResponse, UserSearch, UserUpdate
-from api.database import User, get_db
-from sqlalchemy import select
+from api.database import User
+from api.services.user import get_user_by_telegram_id
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Annotated
 
-router = APIRouter(prefix="/api/users", tags=["Users"])
+router = APIRouter(prefix="/api/users", tags=["Users"], route_class=NegotiatedRoute)
 
 @router.post("/", response_model=UserResponse)
+@limit_class("write")
 async def add_user(
     user: UserCreate, 
-    db: Annotated[AsyncSession, Depends(get_db)]
+    db: Annotated[AsyncSession, Depends(get_db)],
+    tenant: Annotated[str, Depends(get_tenant)]
 ):
     """Добавление пользователя"""
     
     # Проверяем, не существует ли уже пользователь с таким id_telegram
-    result = await db.execute(select(User).where(User.id_telegram == user.id_telegram))
+    result = await db.execute(
+        select(User).where(User.tenant_id == tenant, User.id_telegram == user.id_telegram)
+    )
     existing_user = result.scalar_one_or_none()
     
     if existing_user:
@@ -27,6 +36,7 @@ async def add_user(
     
     # Создаем объект пользователя для БД
     db_user = User(
+        tenant_id=tenant,
         id_telegram=user.id_telegram,
         full_name=user.full_name,
         phone=user.phone,
@@ -42,17 +52,27 @@ async def add_user(
     
 
 @router.get("/{id_telegram}", response_model=UserResponse)
+@limit_class("read")
 async def get_user(
     id_telegram: int,
-    db: Annotated[AsyncSession, Depends(get_db)]
+    db: Annotated[AsyncSession, Depends(get_db)],
+    tenant: Annotated[str, Depends(get_tenant)],
+    fields: Annotated[list[str] | None, Depends(get_fields(UserResponse))]
 ):
     """Получение пользователя по Telegram ID"""
     
     # Выполняем асинхронный запрос к БД
-    result = await db.execute(
-        select(User).where(User.id_telegram == id_telegram)
-    )
-    user = result.scalar_one_or_none()
+    if fields is not None:
+        result = await db.execute(
+            select(*(getattr(User, field) for field in fields))
+            .where(User.tenant_id == tenant, User.id_telegram == id_telegram)
+        )
+        user = result.mappings().one_or_none()
+    else:
+        result = await db.execute(
+            select(User).where(User.tenant_id == tenant, User.id_telegram == id_telegram)
+        )
+        user = result.scalar_one_or_none()
     
     # Если пользователь не найден - возвращаем 404
     if not user:
@@ -60,15 +80,20 @@ async def get_user(
             status_code=404,
             detail="Пользователь с указанным Telegram ID не найден"
         )
-    
+
+    if fields is not None:
+        return NegotiatedResponse(dump_fields(UserResponse, user, fields))
     return user
     
     
 
 @router.patch("/{id_telegram}/document", deprecated=True)
+@limit_class("write")
 async def update_document(
     id_telegram: int,
     db: Annotated[AsyncSession, Depends(get_db)],
+    tenant: Annotated[str, Depends(get_tenant)],
+    manager_tg_id: Annotated[int, Depends(get_editing_manager)],
     doc_name: str | None = None,
     current_user: User = Depends(get_current_user)
 ):
@@ -77,6 +102,7 @@ async def update_document(
     
     Параметры:
     - id_telegram: ID пользователя в Telegram
+    - manager_tg_id: ID менеджера, вносящего изменения
     - doc_name: Название документа (опционально)
     - current_user: Авторизованный пользователь (из зависимости)
     """
@@ -86,6 +112,7 @@ async def update_document(
     
     try:
         await db.commit()
+        audit_writer.record(tenant, "user.update", "user", id_telegram, manager_tg_id, document=doc_name)
         await db.refresh(current_user)
         return {
             "status": "success",
@@ -100,6 +127,7 @@ async def update_document(
         )
 
 @router.get("/{id_telegram}/is_manager")
+@limit_class("read")
 async def check_manager(
     id_telegram: int,
     db: Annotated[AsyncSession, Depends(get_db)],
@@ -110,11 +138,18 @@ async def check_manager(
 
 
 @router.post("/search/", response_model=UserList)
+@limit_class("read")
 async def search_user(
     db: Annotated[AsyncSession, Depends(get_db)],
+    tenant: Annotated[str, Depends(get_tenant)],
+    fields: Annotated[list[str] | None, Depends(get_fields(UserResponse))],
     search_query: UserSearch = None
 ):
-    query = select(User)
+    if fields is not None:
+        query = select(*(getattr(User, field) for field in fields))
+    else:
+        query = select(User)
+    query = query.where(User.tenant_id == tenant)
     if search_query is not None:
         name = search_query.name
         phone = search_query.phone
@@ -135,36 +170,60 @@ async def search_user(
     
     # Выполняем запрос
     result = await db.execute(query)
-    users = result.scalars().all()
+    users = result.mappings().all() if fields is not None else result.scalars().all()
     
     if not users:
         raise HTTPException(status_code=404, detail="Ни один пользователь не найден")
-    
+
+    if fields is not None:
+        return NegotiatedResponse({"users": [dump_fields(UserResponse, user, fields) for user in users]})
     return {"users": users}
     
     
 
 @router.patch("/{id_telegram}", response_model=UserResponse)
+@limit_class("write")
 async def update_user(
     id_telegram: int,
     user_data: UserUpdate,
+    response: Response,
     db: Annotated[AsyncSession, Depends(get_db)],
-    current_user: User = Depends(get_current_user)
+    tenant: Annotated[str, Depends(get_tenant)],
+    expected_versions: Annotated[list[int] | None, Depends(get_if_match)],
+    manager_tg_id: Annotated[int, Depends(get_editing_manager)]
 ):
     """Обновление информации о пользователе"""
 
-    # Обновляем только переданные поля
+    # Обновляем только переданные поля одним UPDATE ... RETURNING
     update_data = user_data.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(current_user, field, value)
+    query = update(User).where(User.tenant_id == tenant, User.id_telegram == id_telegram)
+    if expected_versions is not None:
+        query = query.where(User.version.in_(expected_versions))
 
     try:
+        result = await db.execute(
+            query.values(**update_data, version=User.version + 1)
+            .returning(User)
+            .execution_options(synchronize_session=False)
+        )
+        user = result.scalar_one_or_none()
+        if user is None:
+            await db.rollback()
+            if not await get_user_by_telegram_id(id_telegram, tenant, db):
+                raise HTTPException(status_code=404, detail="User not found")
+            raise HTTPException(status_code=412, detail="Пользователь был изменен другим пользователем")
+
+        user_response = UserResponse.model_validate(user, from_attributes=True)
         await db.commit()
-        await db.refresh(current_user)
-        return current_user
+    except HTTPException:
+        raise
     except Exception as e:
         await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Ошибка при обновлении: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+    audit_writer.record(tenant, "user.update", "user", id_telegram, manager_tg_id, **update_data)
+    response.headers["ETag"] = etag(user_response.version)
+    return user_response
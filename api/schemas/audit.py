@@ -0,0 +1,21 @@
+from datetime import datetime
+from typing import Any
+from pydantic import BaseModel, Field
+
+
+class AuditEntry(BaseModel):
+    """Запись журнала действий"""
+    id: int
+    created_at: datetime
+    actor_tg_id: int | None = Field(None, example=98765)
+    action: str = Field(..., example="rental.return")
+    entity: str = Field(..., example="rental")
+    entity_id: int = Field(..., example=1)
+    payload: dict[str, Any] | None = Field(None, example={"quantity": 2})
+
+    class Config:
+        from_attributes = True
+
+
+class AuditList(BaseModel):
+    items: list[AuditEntry]
@@ -0,0 +1,9 @@
+from typing import Any, Mapping
+from pydantic import BaseModel
+
+
+def dump_fields(schema: type[BaseModel], data: Mapping[str, Any], fields: list[str]) -> dict:
+    """Сериализация только запрошенных полей схемы (sparse fieldsets)"""
+    # model_construct не валидирует отсутствующие поля, а форматирование
+    # (например, дат в RentalBase) остается за схемой
+    return schema.model_construct(**data).model_dump(mode="json", include=set(fields))
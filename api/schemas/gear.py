@@ -31,6 +31,7 @@ class GearResponse(GearBase):
     """Схема для возврата данных о снаряжении"""
     id: int
     available_count: int = Field(..., ge=0, example=7) #duplicates with field in base class
+    version: int = Field(..., description="Версия записи (ETag для If-Match)", example=3)
 
     class Config:
         from_attributes = True  # Для совместимости с ORM (альтернатива orm_mode в Pydantic v2)
@@ -39,6 +40,12 @@ class GearSearchResponse(BaseModel):
     """Схема для возврата списка снаряжения"""
     items: list[GearResponse] = Field(..., description="Список элементов снаряжения")
 
+class GearChanges(BaseModel):
+    """Схема для возврата изменений каталога с момента токена"""
+    items: list[GearResponse] = Field(..., description="Измененное снаряжение в порядке изменений")
+    next_token: int = Field(..., description="Токен для следующего запроса изменений", example=42)
+    has_more: bool = Field(..., description="Есть ли еще изменения после next_token")
+
 class GearUpdate(BaseModel):
     """Схема для обновления данных снаряжения"""
     name: str = Field(None, min_length=1, max_length=100, example="Кошки жесткие")
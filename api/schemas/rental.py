@@ -53,6 +53,7 @@ class RentalResponse(RentalBase):
     issue_date: date
     return_date: date | None
     gear_name: str = Field(..., example="палатка red fox")
+    version: int = Field(..., description="Версия записи (ETag для If-Match)", example=1)
     
     class Config:
         from_attributes = True
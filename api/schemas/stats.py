@@ -0,0 +1,36 @@
+from datetime import date
+from pydantic import BaseModel, Field
+
+
+class StatsCounters(BaseModel):
+    """Общие показатели статистики выдач"""
+    rentals_count: int = Field(..., example=12)
+    quantity_issued: int = Field(..., example=20)
+    gear_days: int = Field(..., description="Единицы снаряжения × дни (по возвращенному)", example=140)
+    overdue_returns: int = Field(..., example=2)
+    avg_overdue_days: float | None = Field(None, description="Средняя просрочка возврата, дней", example=3.5)
+
+
+class GearStats(StatsCounters):
+    gear_id: int
+    gear_name: str = Field(..., example="палатка red fox")
+
+
+class EventStats(StatsCounters):
+    event: str = Field(..., example="Поход на Эльбрус")
+
+
+class MonthStats(StatsCounters):
+    month: date = Field(..., example="2024-06-01")
+
+
+class GearStatsList(BaseModel):
+    items: list[GearStats]
+
+
+class EventStatsList(BaseModel):
+    items: list[EventStats]
+
+
+class MonthStatsList(BaseModel):
+    items: list[MonthStats]
@@ -13,6 +13,7 @@ class UserResponse(UserBase):
     phone: str
     document: str | None
     is_manager: bool
+    version: int = Field(..., description="Версия записи (ETag для If-Match)")
 
 class UserSearch(BaseModel):
     name: str | None = None
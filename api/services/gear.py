@@ -1,13 +1,29 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import func, select
 from api.database import Gear
 
 async def get_gear_by_id(
     gear_id: int,
+    tenant_id: str,
     session: AsyncSession
 ) -> Gear | None:
     """Получение снаряжения по ID"""
     result = await session.execute(
-        select(Gear).where(Gear.id == gear_id)
+        select(Gear).where(Gear.tenant_id == tenant_id, Gear.id == gear_id)
     )
-    return result.scalars().first()
\ No newline at end of file
+    return result.scalars().first()
+
+
+async def lock_gear_changes(
+    tenant_id: str,
+    session: AsyncSession,
+    exclusive: bool = False
+) -> None:
+    """Блокировка, упорядочивающая изменения каталога клуба и чтение дельты.
+
+    Изменения берут ее в разделяемом режиме до получения change_seq, чтение
+    дельты — в исключительном и только на время чтения max(change_seq): все
+    изменения с меньшим номером к этому моменту уже закоммичены.
+    """
+    lock = func.pg_advisory_xact_lock if exclusive else func.pg_advisory_xact_lock_shared
+    await session.execute(select(lock(func.hashtext(f"gear_changes:{tenant_id}"))))
\ No newline at end of file
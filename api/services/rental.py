@@ -3,10 +3,11 @@ from sqlalchemy import select
 from api.database import Rental
 
 async def get_rental_by_id(
-    rental_id: int, 
+    rental_id: int,
+    tenant_id: str,
     session: AsyncSession
 ) -> Rental | None:
     result = await session.execute(
-        select(Rental).where(Rental.id == rental_id)
+        select(Rental).where(Rental.tenant_id == tenant_id, Rental.id == rental_id)
     )
     return result.scalars().first()
\ No newline at end of file
@@ -0,0 +1,147 @@
+from datetime import date, datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Date, RowMapping, case, cast, delete, func, literal_column, select, text
+from sqlalchemy.dialects.postgresql import insert
+from api.database import EventMonthStats, GearMonthStats, Rental
+
+
+def month_start(value: date | datetime) -> date:
+    """Первое число месяца (ключ агрегатов)"""
+    return date(value.year, value.month, 1)
+
+
+async def _increment(session: AsyncSession, model, key: dict, **counters: int) -> None:
+    """Атомарное увеличение счетчиков агрегата (INSERT ... ON CONFLICT DO UPDATE)"""
+    stmt = insert(model).values(**key, **counters)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key),
+        set_={name: getattr(model, name) + stmt.excluded[name] for name in counters}
+    )
+    await session.execute(stmt)
+
+
+def rental_counters() -> dict:
+    """Вклад выдачи в счетчики агрегатов (SQL-выражения по строке rentals).
+
+    Возвраты копятся в самой записи (record_return). Для выдач, заведенных до
+    появления этих колонок, вклад оценивается по оставшемуся количеству.
+    """
+    issue_date = cast(Rental.issue_date, Date)
+    return_date = cast(Rental.return_date, Date)
+    is_overdue = Rental.return_date.is_not(None) & (return_date > Rental.due_date)
+    return {
+        "rentals_count": literal_column("1"),
+        "quantity_issued": func.coalesce(Rental.issued_quantity, Rental.quantity),
+        "gear_days": func.coalesce(Rental.gear_days, case(
+            (Rental.return_date.is_not(None), Rental.quantity * func.greatest(return_date - issue_date, 1)),
+            else_=0
+        )),
+        "overdue_returns": func.coalesce(Rental.overdue_returns, case((is_overdue, 1), else_=0)),
+        "overdue_days": func.coalesce(Rental.overdue_days, case((is_overdue, return_date - Rental.due_date), else_=0)),
+    }
+
+
+async def _increment_rollups(session: AsyncSession, rental: Rental, **counters: int) -> None:
+    month = month_start(rental.issue_date)
+    await _increment(
+        session, GearMonthStats,
+        {"tenant_id": rental.tenant_id, "gear_id": rental.gear_id, "month": month}, **counters
+    )
+    await _increment(
+        session, EventMonthStats,
+        {"tenant_id": rental.tenant_id, "event": rental.event, "month": month}, **counters
+    )
+
+
+async def record_issue(session: AsyncSession, rental: Rental) -> None:
+    """Учет выдачи в агрегатах. Вызывается в транзакции add_record до commit"""
+    await _increment_rollups(session, rental, rentals_count=1, quantity_issued=rental.quantity)
+
+
+async def record_return(
+    session: AsyncSession,
+    rental: Rental,
+    quantity: int,
+    returned_at: date | datetime
+) -> None:
+    """Учет возврата (в том числе частичного) в агрегатах"""
+    if isinstance(returned_at, datetime):
+        returned_at = returned_at.date()
+    issue_date = rental.issue_date.date() if isinstance(rental.issue_date, datetime) else rental.issue_date
+    overdue_days = max((returned_at - rental.due_date).days, 0)
+    counters = {
+        "gear_days": quantity * max((returned_at - issue_date).days, 1),
+        "overdue_returns": int(overdue_days > 0),
+        "overdue_days": overdue_days,
+    }
+    await _increment_rollups(session, rental, **counters)
+
+    # Тот же вклад копится в записи, чтобы пересчет и перенос агрегатов его видели
+    if rental.issued_quantity is None:
+        rental.issued_quantity = rental.quantity
+    for name, value in counters.items():
+        setattr(rental, name, (getattr(rental, name) or 0) + value)
+
+
+async def get_rollup_contribution(session: AsyncSession, tenant_id: str, rental_id: int) -> RowMapping | None:
+    """Ключи и вклад выдачи в агрегатах. Блокирует запись до конца транзакции"""
+    result = await session.execute(
+        select(
+            Rental.tenant_id, Rental.gear_id, Rental.event, Rental.issue_date,
+            *(value.label(name) for name, value in rental_counters().items())
+        )
+        .where(Rental.tenant_id == tenant_id, Rental.id == rental_id)
+        .with_for_update()
+    )
+    return result.mappings().one_or_none()
+
+
+async def record_rekey(session: AsyncSession, old: RowMapping, rental: Rental) -> None:
+    """Перенос вклада выдачи в агрегатах при смене снаряжения или мероприятия"""
+    month = month_start(old["issue_date"])
+    counters = {name: old[name] for name in rental_counters()}
+    for model, key_name in ((GearMonthStats, "gear_id"), (EventMonthStats, "event")):
+        old_value, new_value = old[key_name], getattr(rental, key_name)
+        if old_value == new_value:
+            continue
+        # Строки агрегатов обновляются в порядке ключей, чтобы встречные переносы не взаимоблокировались
+        moves = sorted([(old_value, -1), (new_value, 1)])
+        for value, sign in moves:
+            await _increment(
+                session, model, {"tenant_id": old["tenant_id"], key_name: value, "month": month},
+                **{name: sign * count for name, count in counters.items()}
+            )
+        # Пересчет не создает строк без выдач, поэтому и здесь их не оставляем
+        key = getattr(model, key_name)
+        await session.execute(
+            delete(model).where(
+                model.tenant_id == old["tenant_id"], key == old_value,
+                model.month == month, model.rentals_count == 0
+            )
+        )
+
+
+async def rebuild_rollups(session: AsyncSession) -> None:
+    """Полный пересчет агрегатов по таблице rentals (для заполнения истории).
+
+    Суммирует тот же вклад выдач, что копится инкрементально (rental_counters).
+    """
+    month = cast(func.date_trunc("month", Rental.issue_date), Date)
+    counters = {name: func.sum(value) for name, value in rental_counters().items()}
+
+    # Блокируем выдачи и возвраты на время пересчета, чтобы не потерять инкременты
+    await session.execute(text("LOCK TABLE rentals IN SHARE MODE"))
+    await session.execute(delete(GearMonthStats))
+    await session.execute(delete(EventMonthStats))
+    for model, key_column, key_name in (
+        (GearMonthStats, Rental.gear_id, "gear_id"),
+        (EventMonthStats, Rental.event, "event"),
+    ):
+        await session.execute(
+            insert(model).from_select(
+                ["tenant_id", key_name, "month", *counters],
+                select(Rental.tenant_id, key_column, month, *counters.values())
+                .group_by(Rental.tenant_id, key_column, month)
+            )
+        )
+    await session.commit()
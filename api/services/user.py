@@ -4,10 +4,11 @@ from api.database import User
 
 async def get_user_by_telegram_id(
     telegram_id: int,
+    tenant_id: str,
     session: AsyncSession
 ) -> User | None:
     """Получение пользователя по Telegram ID"""
     result = await session.execute(
-        select(User).where(User.id_telegram == telegram_id)
+        select(User).where(User.tenant_id == tenant_id, User.id_telegram == telegram_id)
     )
     return result.scalars().first()
\ No newline at end of file
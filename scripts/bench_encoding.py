@@ -0,0 +1,75 @@
+"""Сравнение размера и времени кодирования списков аренды: JSON / msgpack, gzip / brotli.
+
+Запуск из корня репозитория:
+    python -m scripts.bench_encoding
+"""
+import gzip
+import json
+import time
+from datetime import date, timedelta
+
+import brotli
+import msgpack
+
+from api.schemas.rental import RentalResponse, RentalsList
+
+SIZES = (1_000, 10_000)
+REPEATS = 5
+
+
+def make_rentals(count: int) -> RentalsList:
+    today = date.today()
+    return RentalsList(rentals=[
+        RentalResponse(
+            id=i,
+            user_telegram_id=100_000 + i % 300,
+            gear_id=i % 150,
+            quantity=1 + i % 3,
+            due_date=today + timedelta(days=i % 30),
+            event=f"Поход №{i % 40} на Эльбрус",
+            comment="Срочно!" if i % 5 == 0 else None,
+            issue_manager_tg_id=98765,
+            accept_manager_tg_id=None,
+            issue_date=today,
+            return_date=None,
+            gear_name=f"Палатка 4-местная RF Challenger #{i % 150}",
+            version=1,
+        )
+        for i in range(count)
+    ])
+
+
+def measure(encode, payload) -> tuple[bytes, float]:
+    """Лучшее время из REPEATS прогонов, мс"""
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        body = encode(payload)
+        best = min(best, time.perf_counter() - start)
+    return body, best * 1000
+
+
+def main():
+    encoders = {
+        "json": lambda content: json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        "msgpack": msgpack.packb,
+    }
+    compressors = {
+        "raw": lambda body: body,
+        "gzip": lambda body: gzip.compress(body, compresslevel=9),
+        "br": lambda body: brotli.compress(body, quality=4),
+    }
+
+    print(f"{'rows':>6} {'encoding':>8} {'compr':>5} {'bytes':>10} {'encode, ms':>11} {'compress, ms':>13}")
+    for size in SIZES:
+        # Так же, как FastAPI сериализует response_model перед отправкой
+        content = make_rentals(size).model_dump(mode="json")
+        for name, encode in encoders.items():
+            body, encode_ms = measure(encode, content)
+            for compr, compress in compressors.items():
+                compressed, compress_ms = measure(compress, body)
+                print(f"{size:>6} {name:>8} {compr:>5} {len(compressed):>10} {encode_ms:>11.2f} {compress_ms:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()